@@ -30,7 +30,13 @@ def iot_pnp_service_factory(cli_ctx, *_):
                                    subscription_bound=False, base_url_bound=False)
 
 
+# PnP clients by repository endpoint, so repeated calls in one process share a connection pool
+_pnp_clients = {}
+
+
 def get_pnp_client(repo_endpoint):
     # pylint: disable=line-too-long
     from .digitaltwinrepositoryprovisioningservice.digital_twin_repository_provisioning_service import DigitalTwinRepositoryProvisioningService
-    return DigitalTwinRepositoryProvisioningService(repo_endpoint)
+    if repo_endpoint not in _pnp_clients:
+        _pnp_clients[repo_endpoint] = DigitalTwinRepositoryProvisioningService(repo_endpoint)
+    return _pnp_clients[repo_endpoint]
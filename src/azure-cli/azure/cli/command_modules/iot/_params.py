@@ -3,24 +3,25 @@
 # Licensed under the MIT License. See License.txt in the project root for license information.
 # --------------------------------------------------------------------------------------------
 
+import argparse
+import time
+
 from argcomplete.completers import FilesCompleter
-from knack.arguments import CLIArgumentType
+from knack.arguments import CLIArgumentType, CaseInsensitiveList
 
+from azure.cli.core.decorators import Completer
 from azure.cli.core.commands.parameters import (get_location_type,
                                                 file_type,
                                                 get_resource_name_completion_list,
                                                 get_enum_type,
                                                 get_three_state_flag)
-from azure.mgmt.iothub.models import IotHubSku
-from azure.mgmt.iothubprovisioningservices.models import (IotDpsSku,
-                                                          AllocationPolicy,
-                                                          AccessRightsDescription)
 from azure.cli.command_modules.iot.shared import (EndpointType,
                                                   RouteSourceType,
                                                   EncodingFormat,
                                                   RenewKeyType,
-                                                  UserRole)
-from .custom import KeyType, SimpleAccessRights
+                                                  UserRole,
+                                                  KeyType,
+                                                  SimpleAccessRights)
 from ._validators import (validate_policy_permissions,
                           validate_retention_days,
                           validate_fileupload_notification_max_delivery_count,
@@ -33,30 +34,115 @@ from ._validators import (validate_policy_permissions,
                           validate_c2d_ttl)
 
 
+def _get_cached_resource_name_completion_list(resource_type, ttl=60):
+    # Reuse the ARM listing for repeated completions within one process (e.g. az interactive).
+    completer = get_resource_name_completion_list(resource_type)
+    cache = {}
+
+    @Completer
+    def cached_completer(cmd, prefix, namespace, **kwargs):  # pylint: disable=unused-argument
+        from azure.cli.core._profile import Profile
+        # key on the active subscription too, so 'az account set' doesn't serve stale names
+        key = (Profile(cli_ctx=cmd.cli_ctx).get_subscription_id(),
+               getattr(namespace, 'resource_group_name', None))
+        now = time.time()
+        cached = cache.get(key)
+        if cached is None or now - cached[0] > ttl:
+            cached = cache[key] = (now, completer.func(cmd, prefix, namespace))
+        return cached[1]
+
+    return cached_completer
+
+
 hub_name_type = CLIArgumentType(
-    completer=get_resource_name_completion_list('Microsoft.Devices/IotHubs'),
+    completer=_get_cached_resource_name_completion_list('Microsoft.Devices/IotHubs'),
     help='IoT Hub name.')
 
 dps_name_type = CLIArgumentType(
     options_list=['--dps-name'],
-    completer=get_resource_name_completion_list('Microsoft.Devices/ProvisioningServices'),
+    completer=_get_cached_resource_name_completion_list('Microsoft.Devices/ProvisioningServices'),
     help='IoT Provisioning Service name')
 
+certificate_path_type = CLIArgumentType(
+    options_list=['--path', '-p'],
+    type=file_type,
+    completer=FilesCompleter([".cer", ".pem"]),
+    help='The path to the file containing the certificate.')
+
+etag_type = CLIArgumentType(
+    options_list=['--etag', '-e'],
+    help='Entity Tag (etag) of the object.')
+
+three_state_flag_type = get_three_state_flag()
+
+dps_subgroups = ('access-policy', 'linked-hub', 'certificate')
+hub_subgroups = ('consumer-group', 'policy', 'job', 'certificate', 'routing-endpoint', 'route')
+
+permissions_help = ('Permissions of shared access policy. Use space-separated list for multiple permissions. '
+                    'Possible values: {}'.format(', '.join(x.value for x in SimpleAccessRights)))
+
+_enum_types = {}
+
+
+def _get_enum_type(enum):
+    # contexts that take the same enum share a single argument type
+    if enum not in _enum_types:
+        _enum_types[enum] = get_enum_type(enum)
+    return _enum_types[enum]
+
+
+# pylint: disable=too-few-public-methods
+class _EnumListAction(argparse.Action):
+    """ Maps each value of a multi-valued enum argument to its canonical casing with a prebuilt lookup. """
+
+    def __init__(self, *args, **kwargs):
+        super(_EnumListAction, self).__init__(*args, **kwargs)
+        self.canonical_choices = {x.lower(): x for x in self.choices}
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, [self.canonical_choices.get(v.lower(), v) for v in values])
+
+
+def _get_enum_list_type(enum):
+    return CLIArgumentType(choices=CaseInsensitiveList([x.value for x in enum]), action=_EnumListAction, nargs='+')
+
+
+def load_arguments(self, command):
+    # Only build the argument contexts of the group being invoked. An empty command means all
+    # arguments are needed, e.g. for help or completion.
+    if _in_group(command, 'iot dps'):
+        _load_dps_arguments(self)
+    if _in_group(command, 'iot hub'):
+        _load_hub_arguments(self)
+    if _in_group(command, 'iot pnp'):
+        _load_pnp_arguments(self)
+
+
+def _in_group(command, group):
+    return not command or command == group or command.startswith(group + ' ')
+
+
+def _load_dps_arguments(self):
+    from azure.mgmt.iothubprovisioningservices.models import (IotDpsSku,
+                                                              AllocationPolicy,
+                                                              AccessRightsDescription)
+
+    location_type = get_location_type(self.cli_ctx)
+    rights_type = _get_enum_list_type(AccessRightsDescription)
 
-def load_arguments(self, _):  # pylint: disable=too-many-statements
     # Arguments for IoT DPS
     with self.argument_context('iot dps') as c:
         c.argument('dps_name', dps_name_type, options_list=['--name', '-n'], id_part='name')
 
     with self.argument_context('iot dps create') as c:
-        c.argument('location', get_location_type(self.cli_ctx),
+        c.argument('location', location_type,
                    help='Location of your IoT Provisioning Service. Default is the location of target resource group.')
-        c.argument('sku', arg_type=get_enum_type(IotDpsSku),
+        c.argument('sku', arg_type=_get_enum_type(IotDpsSku),
                    help='Pricing tier for the IoT provisioning service.')
         c.argument('unit', help='Units in your IoT Provisioning Service.', type=int)
 
-    for subgroup in ['access-policy', 'linked-hub', 'certificate']:
-        with self.argument_context('iot dps {}'.format(subgroup)) as c:
+    for subgroup in dps_subgroups:
+        with self.argument_context('iot dps ' + subgroup) as c:
             c.argument('dps_name', options_list=['--dps-name'], id_part=None)
 
     with self.argument_context('iot dps access-policy') as c:
@@ -64,15 +150,13 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
                    help='A friendly name for DPS access policy.')
 
     with self.argument_context('iot dps access-policy create') as c:
-        c.argument('rights', options_list=['--rights', '-r'], nargs='+',
-                   arg_type=get_enum_type(AccessRightsDescription),
+        c.argument('rights', rights_type, options_list=['--rights', '-r'],
                    help='Access rights for the IoT provisioning service. Use space-separated list for multiple rights.')
         c.argument('primary_key', help='Primary SAS key value.')
         c.argument('secondary_key', help='Secondary SAS key value.')
 
     with self.argument_context('iot dps access-policy update') as c:
-        c.argument('rights', options_list=['--rights', '-r'], nargs='+',
-                   arg_type=get_enum_type(AccessRightsDescription),
+        c.argument('rights', rights_type, options_list=['--rights', '-r'],
                    help='Access rights for the IoT provisioning service. Use space-separated list for multiple rights.')
         c.argument('primary_key', help='Primary SAS key value.')
         c.argument('secondary_key', help='Secondary SAS key value.')
@@ -82,35 +166,38 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
 
     with self.argument_context('iot dps linked-hub create') as c:
         c.argument('connection_string', help='Connection string of the IoT hub.')
-        c.argument('location', get_location_type(self.cli_ctx),
+        c.argument('location', location_type,
                    help='Location of the IoT hub.')
         c.argument('apply_allocation_policy',
                    help='A boolean indicating whether to apply allocation policy to the IoT hub.',
-                   arg_type=get_three_state_flag())
+                   arg_type=three_state_flag_type)
         c.argument('allocation_weight', help='Allocation weight of the IoT hub.')
 
     with self.argument_context('iot dps linked-hub update') as c:
         c.argument('apply_allocation_policy',
                    help='A boolean indicating whether to apply allocation policy to the Iot hub.',
-                   arg_type=get_three_state_flag())
+                   arg_type=three_state_flag_type)
         c.argument('allocation_weight', help='Allocation weight of the IoT hub.')
 
     with self.argument_context('iot dps allocation-policy update') as c:
-        c.argument('allocation_policy', options_list=['--policy', '-p'], arg_type=get_enum_type(AllocationPolicy),
+        c.argument('allocation_policy', options_list=['--policy', '-p'], arg_type=_get_enum_type(AllocationPolicy),
                    help='Allocation policy for the IoT provisioning service.')
 
     with self.argument_context('iot dps certificate') as c:
-        c.argument('certificate_path', options_list=['--path', '-p'], type=file_type,
-                   completer=FilesCompleter([".cer", ".pem"]), help='The path to the file containing the certificate.')
+        c.argument('certificate_path', certificate_path_type)
         c.argument('certificate_name', options_list=['--certificate-name', '--name', '-n'],
                    help='A friendly name for the certificate.')
-        c.argument('etag', options_list=['--etag', '-e'], help='Entity Tag (etag) of the object.')
+        c.argument('etag', etag_type)
+
+
+def _load_hub_arguments(self):  # pylint: disable=too-many-statements
+    from azure.mgmt.iothub.models import IotHubSku
 
     # Arguments for IoT Hub
     with self.argument_context('iot hub') as c:
         c.argument('hub_name', hub_name_type, options_list=['--name', '-n'], id_part='name')
-        c.argument('etag', options_list=['--etag', '-e'], help='Entity Tag (etag) of the object.')
-        c.argument('sku', arg_type=get_enum_type(IotHubSku),
+        c.argument('etag', etag_type)
+        c.argument('sku', arg_type=_get_enum_type(IotHubSku),
                    help='Pricing tier for Azure IoT Hub. Default value is F1, which is free. '
                         'Note that only one free IoT hub instance is allowed in each '
                         'subscription. Exception will be thrown if free instances exceed one.')
@@ -140,7 +227,7 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
                    help='The number of times the IoT hub attempts to'
                         ' deliver a message on the feedback queue, between 1 and 100.')
         c.argument('enable_fileupload_notifications', options_list=['--fileupload-notifications', '--fn'],
-                   arg_type=get_three_state_flag(),
+                   arg_type=three_state_flag_type,
                    help='A boolean indicating whether to log information about uploaded files to the'
                         ' messages/servicebound/filenotifications IoT Hub endpoint.')
         c.argument('fileupload_notification_max_delivery_count', type=int,
@@ -164,8 +251,8 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
                    help='The amount of time a SAS URI generated by IoT Hub is valid before it expires,'
                         ' between 1 and 24 hours.')
 
-    for subgroup in ['consumer-group', 'policy', 'job', 'certificate', 'routing-endpoint', 'route']:
-        with self.argument_context('iot hub {}'.format(subgroup)) as c:
+    for subgroup in hub_subgroups:
+        with self.argument_context('iot hub ' + subgroup) as c:
             c.argument('hub_name', options_list=['--hub-name'])
 
     with self.argument_context('iot hub route') as c:
@@ -174,9 +261,9 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
                    help='Name of the routing endpoint.')
         c.argument('condition', options_list=['--condition', '-c'],
                    help='Condition that is evaluated to apply the routing rule.')
-        c.argument('enabled', options_list=['--enabled', '-e'], arg_type=get_three_state_flag(),
+        c.argument('enabled', options_list=['--enabled', '-e'], arg_type=three_state_flag_type,
                    help='A boolean indicating whether to enable route to the Iot hub.')
-        c.argument('source_type', arg_type=get_enum_type(RouteSourceType),
+        c.argument('source_type', arg_type=_get_enum_type(RouteSourceType),
                    options_list=['--source-type', '--type', '--source', '-s'], help='Source of the route.')
 
     with self.argument_context('iot hub route test') as c:
@@ -197,9 +284,9 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
                    help='Connection string of the Routing Endpoint.')
         c.argument('container_name', options_list=['--container-name', '--container'],
                    help='Name of the storage container.')
-        c.argument('endpoint_type', arg_type=get_enum_type(EndpointType),
+        c.argument('endpoint_type', arg_type=_get_enum_type(EndpointType),
                    options_list=['--endpoint-type', '--type', '-t'], help='Type of the Routing Endpoint.')
-        c.argument('encoding', options_list=['--encoding'], arg_type=get_enum_type(EncodingFormat),
+        c.argument('encoding', options_list=['--encoding'], arg_type=_get_enum_type(EncodingFormat),
                    help='Encoding format for the container. The default is AVRO. '
                         'Note that this field is applicable only for blob container endpoints.')
 
@@ -215,8 +302,7 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
                         ' mandatory but can be reordered with or without delimiters.')
 
     with self.argument_context('iot hub certificate') as c:
-        c.argument('certificate_path', options_list=['--path', '-p'], type=file_type,
-                   completer=FilesCompleter([".cer", ".pem"]), help='The path to the file containing the certificate.')
+        c.argument('certificate_path', certificate_path_type)
         c.argument('certificate_name', options_list=['--name', '-n'], help='A friendly name for the certificate.')
 
     with self.argument_context('iot hub consumer-group') as c:
@@ -227,13 +313,11 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
     with self.argument_context('iot hub policy') as c:
         c.argument('policy_name', options_list=['--name', '-n'], id_part='child_name_1',
                    help='Shared access policy name.')
-        permission_values = ', '.join([x.value for x in SimpleAccessRights])
         c.argument('permissions', nargs='*', validator=validate_policy_permissions, type=str.lower,
-                   help='Permissions of shared access policy. Use space-separated list for multiple permissions. '
-                        'Possible values: {}'.format(permission_values))
+                   help=permissions_help)
 
     with self.argument_context('iot hub policy renew-key') as c:
-        c.argument('regenerate_key', options_list=['--renew-key', '--rk'], arg_type=get_enum_type(RenewKeyType),
+        c.argument('regenerate_key', options_list=['--renew-key', '--rk'], arg_type=_get_enum_type(RenewKeyType),
                    help='Regenerate keys')
 
     with self.argument_context('iot hub job') as c:
@@ -248,7 +332,7 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
         c.argument('show_all', options_list=['--all'], help='Allow to show all shared access policies.')
         c.argument('hub_name', options_list=['--hub-name', '--name', '-n'])
         c.argument('policy_name', help='Shared access policy to use.')
-        c.argument('key_type', arg_type=get_enum_type(KeyType), options_list=['--key'], help='The key to use.')
+        c.argument('key_type', arg_type=_get_enum_type(KeyType), options_list=['--key'], help='The key to use.')
 
     with self.argument_context('iot hub manual-failover') as c:
         c.argument('failover_region', options_list=['--failover-region', '--fr'], help='The region that the IoT hub'
@@ -261,6 +345,8 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
         c.argument('endpoints', options_list=['--endpoints', '-e'], nargs='*',
                    help='Endpoint(s) to apply enrichments to. Use a space-separated list for multiple endpoints.')
 
+
+def _load_pnp_arguments(self):
     # Arguments for IoT Digital Twin
     with self.argument_context('iot pnp') as c:
         c.argument('repo_endpoint', options_list=['--endpoint', '-e'], help='IoT Plug and Play endpoint.')
@@ -276,5 +362,5 @@ def load_arguments(self, _):  # pylint: disable=too-many-statements
     with self.argument_context('iot pnp key') as c:
         c.argument('key_id', options_list=['--key-id', '-k'],
                    help='Access key for the given IoT Plug and Play repository.')
-        c.argument('user_role', options_list=['--role'], arg_type=get_enum_type(UserRole),
+        c.argument('user_role', options_list=['--role'], arg_type=_get_enum_type(UserRole),
                    help='User role of the access key for the given IoT Plug and Play repository.')
@@ -6,10 +6,10 @@
 from os.path import exists, join
 import base64
 import random
-from OpenSSL import crypto
 
 
 def create_self_signed_certificate(device_id, valid_days, cert_output_dir):
+    from OpenSSL import crypto
     cert_file = device_id + '-cert.pem'
     key_file = device_id + '-key.pem'
 
@@ -43,7 +43,7 @@ def create_self_signed_certificate(device_id, valid_days, cert_output_dir):
 
 def open_certificate(certificate_path):
     certificate = ""
-    if certificate_path.endswith('.pem') or certificate_path.endswith('.cer'):
+    if certificate_path.endswith(('.pem', '.cer')):
         with open(certificate_path, "rb") as cert_file:
             certificate = cert_file.read()
             try:
@@ -4,16 +4,17 @@
 # --------------------------------------------------------------------------------------------
 
 from argparse import ArgumentError
-from .custom import SimpleAccessRights
+from azure.cli.command_modules.iot.shared import SimpleAccessRights
+
+_allowed_permissions = frozenset(x.value.lower() for x in SimpleAccessRights)
 
 
 def validate_policy_permissions(ns):
     if ns.permissions is None or ns.permissions == []:
         raise ArgumentError(None, 'the following arguments are required: --permissions')
 
-    allowed = [x.value.lower() for x in SimpleAccessRights]
     for p in ns.permissions:
-        if p not in allowed:
+        if p not in _allowed_permissions:
             raise ValueError('Unrecognized permission "{}"'.format(p))
 
 
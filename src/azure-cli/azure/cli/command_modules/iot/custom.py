@@ -5,66 +5,18 @@
 # pylint: disable=no-self-use,no-member,line-too-long,too-few-public-methods,too-many-lines,too-many-arguments,too-many-locals
 
 from __future__ import print_function
-from enum import Enum
+import weakref
+from datetime import timedelta
+from itertools import chain
 from knack.util import CLIError
 from azure.cli.core.commands import LongRunningOperation
 
-from azure.mgmt.iothub.models import (IotHubSku,
-                                      AccessRights,
-                                      CloudToDeviceProperties,
-                                      IotHubDescription,
-                                      IotHubSkuInfo,
-                                      SharedAccessSignatureAuthorizationRule,
-                                      IotHubProperties,
-                                      EventHubProperties,
-                                      FeedbackProperties,
-                                      MessagingEndpointProperties,
-                                      EnrichmentProperties,
-                                      RoutingEventHubProperties,
-                                      RoutingServiceBusQueueEndpointProperties,
-                                      RoutingServiceBusTopicEndpointProperties,
-                                      RoutingStorageContainerProperties,
-                                      RouteProperties,
-                                      RoutingMessage,
-                                      StorageEndpointProperties,
-                                      TestRouteInput,
-                                      TestAllRoutesInput)
-
-
-from azure.mgmt.iothubprovisioningservices.models import (ProvisioningServiceDescription,
-                                                          IotDpsPropertiesDescription,
-                                                          IotHubDefinitionDescription,
-                                                          IotDpsSkuInfo,
-                                                          IotDpsSku,
-                                                          SharedAccessSignatureAuthorizationRuleAccessRightsDescription)
-
-from azure.cli.command_modules.iot.mgmt_iot_hub_device.lib.iot_hub_device_client import IotHubDeviceClient
-from azure.cli.command_modules.iot.sas_token_auth import SasTokenAuthentication
-from azure.cli.command_modules.iot.shared import EndpointType, EncodingFormat, RenewKeyType
+from azure.cli.command_modules.iot.shared import EndpointType, EncodingFormat, RenewKeyType, KeyType, SimpleAccessRights  # pylint: disable=unused-import
 from ._constants import PNP_ENDPOINT
 from ._client_factory import resource_service_factory, get_pnp_client
 from ._utils import open_certificate, get_auth_header, generateKey
 
 
-# CUSTOM TYPE
-class KeyType(Enum):
-    primary = 'primary'
-    secondary = 'secondary'
-
-
-# This is a work around to simplify the permission parameter for access policy creation, and also align with the other
-# command modules.
-# The original AccessRights enum is a combination of below four basic access rights.
-# In order to avoid asking for comma- & space-separated strings from the user, a space-separated list is supported for
-# assigning multiple permissions.
-# The underlying IoT SDK should handle this. However it isn't right now. Remove this after it is fixed in IoT SDK.
-class SimpleAccessRights(Enum):
-    registry_read = AccessRights.registry_read.value
-    registry_write = AccessRights.registry_write.value
-    service_connect = AccessRights.service_connect.value
-    device_connect = AccessRights.device_connect.value
-
-
 # CUSTOM METHODS FOR DPS
 def iot_dps_list(client, resource_group_name=None):
     if resource_group_name is None:
@@ -78,7 +30,10 @@ def iot_dps_get(client, dps_name, resource_group_name=None):
     return client.iot_dps_resource.get(dps_name, resource_group_name)
 
 
-def iot_dps_create(cmd, client, dps_name, resource_group_name, location=None, sku=IotDpsSku.s1.value, unit=1):
+def iot_dps_create(cmd, client, dps_name, resource_group_name, location=None, sku='S1', unit=1):
+    from azure.mgmt.iothubprovisioningservices.models import (ProvisioningServiceDescription,
+                                                              IotDpsPropertiesDescription,
+                                                              IotDpsSkuInfo)
     cli_ctx = cmd.cli_ctx
     _check_dps_name_availability(client.iot_dps_resource, dps_name)
     location = _ensure_location(cli_ctx, resource_group_name, location)
@@ -109,8 +64,8 @@ def iot_dps_access_policy_get(client, dps_name, resource_group_name, access_poli
 
 
 def iot_dps_access_policy_create(cmd, client, dps_name, resource_group_name, access_policy_name, rights, primary_key=None, secondary_key=None, no_wait=False):
-    dps_access_policies = []
-    dps_access_policies.extend(iot_dps_access_policy_list(client, dps_name, resource_group_name))
+    from azure.mgmt.iothubprovisioningservices.models import SharedAccessSignatureAuthorizationRuleAccessRightsDescription
+    dps, dps_access_policies = _get_dps_and_access_policies(client, dps_name, resource_group_name)
     if _is_policy_existed(dps_access_policies, access_policy_name):
         raise CLIError("Access policy {0} already existed.".format(access_policy_name))
 
@@ -118,63 +73,65 @@ def iot_dps_access_policy_create(cmd, client, dps_name, resource_group_name, acc
     dps_access_policies.append(SharedAccessSignatureAuthorizationRuleAccessRightsDescription(
         key_name=access_policy_name, rights=access_policy_rights, primary_key=primary_key, secondary_key=secondary_key))
 
-    dps = iot_dps_get(client, dps_name, resource_group_name)
-    dps_property = IotDpsPropertiesDescription(iot_hubs=dps.properties.iot_hubs,
-                                               allocation_policy=dps.properties.allocation_policy,
-                                               authorization_policies=dps_access_policies)
-    dps_description = ProvisioningServiceDescription(location=dps.location, properties=dps_property, sku=dps.sku)
+    dps.properties.authorization_policies = dps_access_policies
 
-    if no_wait:
-        return client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description)
-    LongRunningOperation(cmd.cli_ctx)(client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description))
-    return iot_dps_access_policy_get(client, dps_name, resource_group_name, access_policy_name)
+    return _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait,
+                       lambda: iot_dps_access_policy_get(client, dps_name, resource_group_name, access_policy_name))
 
 
 def iot_dps_access_policy_update(cmd, client, dps_name, resource_group_name, access_policy_name, primary_key=None, secondary_key=None, rights=None, no_wait=False):
-    dps_access_policies = []
-    dps_access_policies.extend(iot_dps_access_policy_list(client, dps_name, resource_group_name))
+    dps, dps_access_policies = _get_dps_and_access_policies(client, dps_name, resource_group_name)
 
-    if not _is_policy_existed(dps_access_policies, access_policy_name):
+    policy = _index_by_name(dps_access_policies, 'key_name').get(access_policy_name.lower())
+    if policy is None:
         raise CLIError("Access policy {0} doesn't exist.".format(access_policy_name))
 
-    for policy in dps_access_policies:
-        if policy.key_name == access_policy_name:
-            if primary_key is not None:
-                policy.primary_key = primary_key
-            if secondary_key is not None:
-                policy.secondary_key = secondary_key
-            if rights is not None:
-                policy.rights = _convert_rights_to_access_rights(rights)
+    if primary_key is not None:
+        policy.primary_key = primary_key
+    if secondary_key is not None:
+        policy.secondary_key = secondary_key
+    if rights is not None:
+        policy.rights = _convert_rights_to_access_rights(rights)
 
-    dps = iot_dps_get(client, dps_name, resource_group_name)
-    dps_property = IotDpsPropertiesDescription(iot_hubs=dps.properties.iot_hubs,
-                                               allocation_policy=dps.properties.allocation_policy,
-                                               authorization_policies=dps_access_policies)
-    dps_description = ProvisioningServiceDescription(location=dps.location, properties=dps_property, sku=dps.sku)
+    dps.properties.authorization_policies = dps_access_policies
 
-    if no_wait:
-        return client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description)
-    LongRunningOperation(cmd.cli_ctx)(client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description))
-    return iot_dps_access_policy_get(client, dps_name, resource_group_name, access_policy_name)
+    return _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait,
+                       lambda: iot_dps_access_policy_get(client, dps_name, resource_group_name, access_policy_name))
 
 
 def iot_dps_access_policy_delete(cmd, client, dps_name, resource_group_name, access_policy_name, no_wait=False):
-    dps_access_policies = []
-    dps_access_policies.extend(iot_dps_access_policy_list(client, dps_name, resource_group_name))
-    if not _is_policy_existed(dps_access_policies, access_policy_name):
+    dps, dps_access_policies = _get_dps_and_access_policies(client, dps_name, resource_group_name)
+    target = access_policy_name.lower()
+    updated_policies = [p for p in dps_access_policies
+                        if p.key_name != access_policy_name and p.key_name.lower() != target]
+    if len(updated_policies) == len(dps_access_policies):
         raise CLIError("Access policy {0} doesn't existed.".format(access_policy_name))
-    updated_policies = [p for p in dps_access_policies if p.key_name.lower() != access_policy_name.lower()]
 
-    dps = iot_dps_get(client, dps_name, resource_group_name)
-    dps_property = IotDpsPropertiesDescription(iot_hubs=dps.properties.iot_hubs,
-                                               allocation_policy=dps.properties.allocation_policy,
-                                               authorization_policies=updated_policies)
-    dps_description = ProvisioningServiceDescription(location=dps.location, properties=dps_property, sku=dps.sku)
+    dps.properties.authorization_policies = updated_policies
 
+    return _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait,
+                       lambda: iot_dps_access_policy_list(client, dps_name, resource_group_name))
+
+
+def _get_dps_and_access_policies(client, dps_name, resource_group_name):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def _list_keys():
+        return list(client.iot_dps_resource.list_keys(dps_name, resource_group_name))
+
+    # the service description and its keys are independent requests, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        dps = executor.submit(iot_dps_get, client, dps_name, resource_group_name)
+        dps_access_policies = executor.submit(_list_keys)
+        return dps.result(), dps_access_policies.result()
+
+
+def _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait, get_result):
+    poller = client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps)
     if no_wait:
-        return client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description)
-    LongRunningOperation(cmd.cli_ctx)(client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description))
-    return iot_dps_access_policy_list(client, dps_name, resource_group_name)
+        return poller
+    LongRunningOperation(cmd.cli_ctx)(poller)
+    return get_result()
 
 
 # DPS linked hub methods
@@ -185,15 +142,16 @@ def iot_dps_linked_hub_list(client, dps_name, resource_group_name):
 
 def iot_dps_linked_hub_get(client, dps_name, resource_group_name, linked_hub):
     dps = iot_dps_get(client, dps_name, resource_group_name)
-    for hub in dps.properties.iot_hubs:
-        if hub.name == linked_hub:
-            return hub
+    hub = _index_by_name(dps.properties.iot_hubs, 'name').get(linked_hub.lower())
+    if hub is not None:
+        return hub
     raise CLIError("Linked hub '{0}' does not exist. Use 'iot dps linked-hub show to see all linked hubs.".format(linked_hub))
 
 
 def iot_dps_linked_hub_create(cmd, client, dps_name, resource_group_name, connection_string, location, apply_allocation_policy=None, allocation_weight=None, no_wait=False):
-    dps_linked_hubs = []
-    dps_linked_hubs.extend(iot_dps_linked_hub_list(client, dps_name, resource_group_name))
+    from azure.mgmt.iothubprovisioningservices.models import IotHubDefinitionDescription
+    dps = iot_dps_get(client, dps_name, resource_group_name)
+    dps_linked_hubs = list(dps.properties.iot_hubs)
 
     # Hack due to DPS Swagger/SDK issue
     # In the newer API version the name parameter is required
@@ -204,60 +162,39 @@ def iot_dps_linked_hub_create(cmd, client, dps_name, resource_group_name, connec
                                                        apply_allocation_policy=apply_allocation_policy,
                                                        allocation_weight=allocation_weight))
 
-    dps = iot_dps_get(client, dps_name, resource_group_name)
-    dps_property = IotDpsPropertiesDescription(iot_hubs=dps_linked_hubs,
-                                               allocation_policy=dps.properties.allocation_policy,
-                                               authorization_policies=dps.properties.authorization_policies)
-    dps_description = ProvisioningServiceDescription(location=dps.location, properties=dps_property, sku=dps.sku)
+    dps.properties.iot_hubs = dps_linked_hubs
 
-    if no_wait:
-        return client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description)
-    LongRunningOperation(cmd.cli_ctx)(client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description))
-    return iot_dps_linked_hub_list(client, dps_name, resource_group_name)
+    return _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait,
+                       lambda: iot_dps_linked_hub_list(client, dps_name, resource_group_name))
 
 
 def iot_dps_linked_hub_update(cmd, client, dps_name, resource_group_name, linked_hub, apply_allocation_policy=None, allocation_weight=None, no_wait=False):
-    dps_linked_hubs = []
-    dps_linked_hubs.extend(iot_dps_linked_hub_list(client, dps_name, resource_group_name))
-    if not _is_linked_hub_existed(dps_linked_hubs, linked_hub):
+    dps = iot_dps_get(client, dps_name, resource_group_name)
+    hub = _index_by_name(dps.properties.iot_hubs, 'name').get(linked_hub.lower())
+    if hub is None:
         raise CLIError("Access policy {0} doesn't existed.".format(linked_hub))
 
-    for hub in dps_linked_hubs:
-        if hub.name == linked_hub:
-            if apply_allocation_policy is not None:
-                hub.apply_allocation_policy = apply_allocation_policy
-            if allocation_weight is not None:
-                hub.allocation_weight = allocation_weight
+    if apply_allocation_policy is not None:
+        hub.apply_allocation_policy = apply_allocation_policy
+    if allocation_weight is not None:
+        hub.allocation_weight = allocation_weight
 
-    dps = iot_dps_get(client, dps_name, resource_group_name)
-    dps_property = IotDpsPropertiesDescription(iot_hubs=dps_linked_hubs,
-                                               allocation_policy=dps.properties.allocation_policy,
-                                               authorization_policies=dps.properties.authorization_policies)
-    dps_description = ProvisioningServiceDescription(location=dps.location, properties=dps_property, sku=dps.sku)
-
-    if no_wait:
-        return client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description)
-    LongRunningOperation(cmd.cli_ctx)(client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description))
-    return iot_dps_linked_hub_get(client, dps_name, resource_group_name, linked_hub)
+    return _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait,
+                       lambda: iot_dps_linked_hub_get(client, dps_name, resource_group_name, linked_hub))
 
 
 def iot_dps_linked_hub_delete(cmd, client, dps_name, resource_group_name, linked_hub, no_wait=False):
-    dps_linked_hubs = []
-    dps_linked_hubs.extend(iot_dps_linked_hub_list(client, dps_name, resource_group_name))
-    if not _is_linked_hub_existed(dps_linked_hubs, linked_hub):
+    dps = iot_dps_get(client, dps_name, resource_group_name)
+    dps_linked_hubs = list(dps.properties.iot_hubs)
+    target = linked_hub.lower()
+    updated_hub = [p for p in dps_linked_hubs if p.name != linked_hub and p.name.lower() != target]
+    if len(updated_hub) == len(dps_linked_hubs):
         raise CLIError("Linked hub {0} doesn't existed.".format(linked_hub))
-    updated_hub = [p for p in dps_linked_hubs if p.name.lower() != linked_hub.lower()]
 
-    dps = iot_dps_get(client, dps_name, resource_group_name)
-    dps_property = IotDpsPropertiesDescription(iot_hubs=updated_hub,
-                                               allocation_policy=dps.properties.allocation_policy,
-                                               authorization_policies=dps.properties.authorization_policies)
-    dps_description = ProvisioningServiceDescription(location=dps.location, properties=dps_property, sku=dps.sku)
+    dps.properties.iot_hubs = updated_hub
 
-    if no_wait:
-        return client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description)
-    LongRunningOperation(cmd.cli_ctx)(client.iot_dps_resource.create_or_update(resource_group_name, dps_name, dps_description))
-    return iot_dps_linked_hub_list(client, dps_name, resource_group_name)
+    return _update_dps(cmd, client, resource_group_name, dps_name, dps, no_wait,
+                       lambda: iot_dps_linked_hub_list(client, dps_name, resource_group_name))
 
 
 # DPS certificate methods
@@ -271,10 +208,9 @@ def iot_dps_certificate_get(client, dps_name, resource_group_name, certificate_n
 
 def iot_dps_certificate_create(client, dps_name, resource_group_name, certificate_name, certificate_path):
     cert_list = client.dps_certificate.list(resource_group_name, dps_name)
-    for cert in cert_list.value:
-        if cert.name == certificate_name:
-            raise CLIError("Certificate '{0}' already exists. Use 'iot dps certificate update'"
-                           " to update an existing certificate.".format(certificate_name))
+    if _find_certificate(cert_list, certificate_name) is not None:
+        raise CLIError("Certificate '{0}' already exists. Use 'iot dps certificate update'"
+                       " to update an existing certificate.".format(certificate_name))
     certificate = open_certificate(certificate_path)
     if not certificate:
         raise CLIError("Error uploading certificate '{0}'.".format(certificate_path))
@@ -283,14 +219,13 @@ def iot_dps_certificate_create(client, dps_name, resource_group_name, certificat
 
 def iot_dps_certificate_update(client, dps_name, resource_group_name, certificate_name, certificate_path, etag):
     cert_list = client.dps_certificate.list(resource_group_name, dps_name)
-    for cert in cert_list.value:
-        if cert.name == certificate_name:
-            certificate = open_certificate(certificate_path)
-            if not certificate:
-                raise CLIError("Error uploading certificate '{0}'.".format(certificate_path))
-            return client.dps_certificate.create_or_update(resource_group_name, dps_name, certificate_name, etag, certificate)
-    raise CLIError("Certificate '{0}' does not exist. Use 'iot dps certificate create' to create a new certificate."
-                   .format(certificate_name))
+    if _find_certificate(cert_list, certificate_name) is None:
+        raise CLIError("Certificate '{0}' does not exist. Use 'iot dps certificate create' to create a new certificate."
+                       .format(certificate_name))
+    certificate = open_certificate(certificate_path)
+    if not certificate:
+        raise CLIError("Error uploading certificate '{0}'.".format(certificate_path))
+    return client.dps_certificate.create_or_update(resource_group_name, dps_name, certificate_name, etag, certificate)
 
 
 def iot_dps_certificate_delete(client, dps_name, resource_group_name, certificate_name, etag):
@@ -324,10 +259,9 @@ def iot_hub_certificate_create(client, hub_name, certificate_name, certificate_p
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     # Get list of certs
     cert_list = client.certificates.list_by_iot_hub(resource_group_name, hub_name)
-    for cert in cert_list.value:
-        if cert.name == certificate_name:
-            raise CLIError("Certificate '{0}' already exists. Use 'iot hub certificate update'"
-                           " to update an existing certificate.".format(certificate_name))
+    if _find_certificate(cert_list, certificate_name) is not None:
+        raise CLIError("Certificate '{0}' already exists. Use 'iot hub certificate update'"
+                       " to update an existing certificate.".format(certificate_name))
     certificate = open_certificate(certificate_path)
     if not certificate:
         raise CLIError("Error uploading certificate '{0}'.".format(certificate_path))
@@ -337,14 +271,13 @@ def iot_hub_certificate_create(client, hub_name, certificate_name, certificate_p
 def iot_hub_certificate_update(client, hub_name, certificate_name, certificate_path, etag, resource_group_name=None):
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     cert_list = client.certificates.list_by_iot_hub(resource_group_name, hub_name)
-    for cert in cert_list.value:
-        if cert.name == certificate_name:
-            certificate = open_certificate(certificate_path)
-            if not certificate:
-                raise CLIError("Error uploading certificate '{0}'.".format(certificate_path))
-            return client.certificates.create_or_update(resource_group_name, hub_name, certificate_name, etag, certificate)
-    raise CLIError("Certificate '{0}' does not exist. Use 'iot hub certificate create' to create a new certificate."
-                   .format(certificate_name))
+    if _find_certificate(cert_list, certificate_name) is None:
+        raise CLIError("Certificate '{0}' does not exist. Use 'iot hub certificate create' to create a new certificate."
+                       .format(certificate_name))
+    certificate = open_certificate(certificate_path)
+    if not certificate:
+        raise CLIError("Error uploading certificate '{0}'.".format(certificate_path))
+    return client.certificates.create_or_update(resource_group_name, hub_name, certificate_name, etag, certificate)
 
 
 def iot_hub_certificate_delete(client, hub_name, certificate_name, etag, resource_group_name=None):
@@ -366,7 +299,7 @@ def iot_hub_certificate_verify(client, hub_name, certificate_name, certificate_p
 
 
 def iot_hub_create(cmd, client, hub_name, resource_group_name, location=None,
-                   sku=IotHubSku.f1.value,
+                   sku='F1',
                    unit=1,
                    partition_count=4,
                    retention_day=1,
@@ -381,7 +314,14 @@ def iot_hub_create(cmd, client, hub_name, resource_group_name, location=None,
                    fileupload_storage_connectionstring=None,
                    fileupload_storage_container_name=None,
                    fileupload_sas_ttl=1):
-    from datetime import timedelta
+    from azure.mgmt.iothub.models import (CloudToDeviceProperties,
+                                          IotHubDescription,
+                                          IotHubSkuInfo,
+                                          IotHubProperties,
+                                          EventHubProperties,
+                                          FeedbackProperties,
+                                          MessagingEndpointProperties,
+                                          StorageEndpointProperties)
     cli_ctx = cmd.cli_ctx
     if enable_fileupload_notifications:
         if not fileupload_storage_connectionstring or not fileupload_storage_container_name:
@@ -394,28 +334,23 @@ def iot_hub_create(cmd, client, hub_name, resource_group_name, location=None,
     location = _ensure_location(cli_ctx, resource_group_name, location)
     sku = IotHubSkuInfo(name=sku, capacity=unit)
 
-    event_hub_dic = {}
-    event_hub_dic['events'] = EventHubProperties(retention_time_in_days=retention_day,
-                                                 partition_count=partition_count)
     feedback_Properties = FeedbackProperties(lock_duration_as_iso8601=timedelta(seconds=feedback_lock_duration),
                                              ttl_as_iso8601=timedelta(hours=feedback_ttl),
                                              max_delivery_count=feedback_max_delivery_count)
     cloud_to_device_properties = CloudToDeviceProperties(max_delivery_count=c2d_max_delivery_count,
                                                          default_ttl_as_iso8601=timedelta(hours=c2d_ttl),
                                                          feedback=feedback_Properties)
-    msg_endpoint_dic = {}
-    msg_endpoint_dic['fileNotifications'] = MessagingEndpointProperties(max_delivery_count=fileupload_notification_max_delivery_count,
-                                                                        ttl_as_iso8601=timedelta(hours=fileupload_notification_ttl))
-    storage_endpoint_dic = {}
-    storage_endpoint_dic['$default'] = StorageEndpointProperties(
-        sas_ttl_as_iso8601=timedelta(hours=fileupload_sas_ttl),
-        connection_string=fileupload_storage_connectionstring if fileupload_storage_connectionstring else '',
-        container_name=fileupload_storage_container_name if fileupload_storage_container_name else '')
-
-    properties = IotHubProperties(event_hub_endpoints=event_hub_dic,
-                                  messaging_endpoints=msg_endpoint_dic,
-                                  storage_endpoints=storage_endpoint_dic,
-                                  cloud_to_device=cloud_to_device_properties)
+    properties = IotHubProperties(
+        event_hub_endpoints={'events': EventHubProperties(retention_time_in_days=retention_day,
+                                                          partition_count=partition_count)},
+        messaging_endpoints={'fileNotifications': MessagingEndpointProperties(
+            max_delivery_count=fileupload_notification_max_delivery_count,
+            ttl_as_iso8601=timedelta(hours=fileupload_notification_ttl))},
+        storage_endpoints={'$default': StorageEndpointProperties(
+            sas_ttl_as_iso8601=timedelta(hours=fileupload_sas_ttl),
+            connection_string=fileupload_storage_connectionstring or '',
+            container_name=fileupload_storage_container_name or '')},
+        cloud_to_device=cloud_to_device_properties)
     properties.enable_file_upload_notifications = enable_fileupload_notifications
 
     hub_description = IotHubDescription(location=location,
@@ -431,17 +366,19 @@ def _check_name_availability(iot_hub_resource, hub_name):
         raise CLIError(name_availability.message)
 
 
-def iot_hub_get(cmd, client, hub_name, resource_group_name=None):
-    cli_ctx = cmd.cli_ctx
+def iot_hub_get(cmd, client, hub_name, resource_group_name=None):  # pylint: disable=unused-argument
     if resource_group_name is None:
         return _get_iot_hub_by_name(client, hub_name)
-    if not _ensure_resource_group_existence(cli_ctx, resource_group_name):
-        raise CLIError("Resource group '{0}' could not be found.".format(resource_group_name))
-    name_availability = client.iot_hub_resource.check_name_availability(hub_name)
-    if name_availability is not None and name_availability.name_available:
+    from azure.mgmt.iothub.models import ErrorDetailsException
+    try:
+        return client.iot_hub_resource.get(resource_group_name, hub_name)
+    except ErrorDetailsException as ex:
+        if ex.response is None or ex.response.status_code != 404:
+            raise
+        if 'ResourceGroupNotFound' in (ex.response.text or ''):
+            raise CLIError("Resource group '{0}' could not be found.".format(resource_group_name))
         raise CLIError("An IotHub '{0}' under resource group '{1}' was not found."
                        .format(hub_name, resource_group_name))
-    return client.iot_hub_resource.get(resource_group_name, hub_name)
 
 
 def iot_hub_list(client, resource_group_name=None):
@@ -465,7 +402,6 @@ def update_iot_hub_custom(instance,
                           fileupload_storage_connectionstring=None,
                           fileupload_storage_container_name=None,
                           fileupload_sas_ttl=None):
-    from datetime import timedelta
     if sku is not None:
         instance.sku.name = sku
     if unit is not None:
@@ -514,29 +450,37 @@ def iot_hub_delete(client, hub_name, resource_group_name=None):
 
 
 # pylint: disable=inconsistent-return-statements
-def iot_hub_show_connection_string(client, hub_name=None, resource_group_name=None, policy_name='iothubowner',
+def iot_hub_show_connection_string(cmd, client, hub_name=None, resource_group_name=None, policy_name='iothubowner',
                                    key_type=KeyType.primary.value, show_all=False):
     if hub_name is None:
+        from concurrent.futures import ThreadPoolExecutor
         hubs = iot_hub_list(client, resource_group_name)
         if hubs is None:
             raise CLIError("No IoT Hub found.")
+        hubs = list(hubs)
+        if not hubs:
+            return []
 
         def conn_str_getter(h):
-            return _get_hub_connection_string(client, h.name, h.additional_properties['resourcegroup'], policy_name, key_type, show_all)
-        return [{'name': h.name, 'connectionString': conn_str_getter(h)} for h in hubs]
-    resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
-    conn_str = _get_hub_connection_string(client, hub_name, resource_group_name, policy_name, key_type, show_all)
+            return _get_hub_connection_string(client, h, h.additional_properties['resourcegroup'], policy_name, key_type, show_all)
+        # each hub needs its own key lookup, so issue those requests concurrently
+        with ThreadPoolExecutor(max_workers=min(16, len(hubs))) as executor:
+            conn_strs = list(executor.map(conn_str_getter, hubs))
+        return [{'name': h.name, 'connectionString': c} for h, c in zip(hubs, conn_strs)]
+    hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
+    if resource_group_name is None:
+        resource_group_name = hub.additional_properties['resourcegroup']
+    conn_str = _get_hub_connection_string(client, hub, resource_group_name, policy_name, key_type, show_all)
     return {'connectionString': conn_str if show_all else conn_str[0]}
 
 
-def _get_hub_connection_string(client, hub_name, resource_group_name, policy_name, key_type, show_all):
+def _get_hub_connection_string(client, hub, resource_group_name, policy_name, key_type, show_all):
     policies = []
     if show_all:
-        policies.extend(iot_hub_policy_list(client, hub_name, resource_group_name))
+        policies.extend(iot_hub_policy_list(client, hub.name, resource_group_name))
     else:
-        policies.append(iot_hub_policy_get(client, hub_name, policy_name, resource_group_name))
+        policies.append(iot_hub_policy_get(client, hub.name, policy_name, resource_group_name))
     # Intermediate fix to support domains beyond azure-devices.netproperty
-    hub = _get_iot_hub_by_name(client, hub_name)
     hostname = hub.properties.host_name
     conn_str_template = 'HostName={};SharedAccessKeyName={};SharedAccessKey={}'
     return [conn_str_template.format(hostname,
@@ -580,10 +524,9 @@ def iot_hub_policy_get(client, hub_name, policy_name, resource_group_name=None):
 
 
 def iot_hub_policy_create(cmd, client, hub_name, policy_name, permissions, resource_group_name=None):
+    from azure.mgmt.iothub.models import SharedAccessSignatureAuthorizationRule
     rights = _convert_perms_to_access_rights(permissions)
-    hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    policies = []
-    policies.extend(iot_hub_policy_list(client, hub_name, hub.additional_properties['resourcegroup']))
+    hub, policies = _get_hub_and_policies(cmd, client, hub_name, resource_group_name)
     if _is_policy_existed(policies, policy_name):
         raise CLIError("Policy {0} already existed.".format(policy_name))
     policies.append(SharedAccessSignatureAuthorizationRule(key_name=policy_name, rights=rights))
@@ -592,36 +535,41 @@ def iot_hub_policy_create(cmd, client, hub_name, policy_name, permissions, resou
 
 
 def iot_hub_policy_delete(cmd, client, hub_name, policy_name, resource_group_name=None):
-    import copy
-    hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    policies = iot_hub_policy_list(client, hub_name, hub.additional_properties['resourcegroup'])
-    if not _is_policy_existed(copy.deepcopy(policies), policy_name):
+    hub, policies = _get_hub_and_policies(cmd, client, hub_name, resource_group_name)
+    target = policy_name.lower()
+    updated_policies = [p for p in policies if p.key_name != policy_name and p.key_name.lower() != target]
+    if len(updated_policies) == len(policies):
         raise CLIError("Policy {0} not found.".format(policy_name))
-    updated_policies = [p for p in policies if p.key_name.lower() != policy_name.lower()]
     hub.properties.authorization_policies = updated_policies
     return client.iot_hub_resource.create_or_update(hub.additional_properties['resourcegroup'], hub_name, hub, {'IF-MATCH': hub.etag})
 
 
 def iot_hub_policy_key_renew(cmd, client, hub_name, policy_name, regenerate_key, resource_group_name=None, no_wait=False):
-    hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    policies = []
-    policies.extend(iot_hub_policy_list(client, hub_name, hub.additional_properties['resourcegroup']))
-    if not _is_policy_existed(policies, policy_name):
+    from azure.mgmt.iothub.models import SharedAccessSignatureAuthorizationRule
+    hub, policies = _get_hub_and_policies(cmd, client, hub_name, resource_group_name)
+    target = policy_name.lower()
+    requested_policy = None
+    updated_policies = []
+    for p in policies:
+        if p.key_name == policy_name or p.key_name.lower() == target:
+            if requested_policy is None:
+                requested_policy = p
+        else:
+            updated_policies.append(p)
+    if requested_policy is None:
         raise CLIError("Policy {0} not found.".format(policy_name))
-    updated_policies = [p for p in policies if p.key_name.lower() != policy_name.lower()]
-    requested_policy = [p for p in policies if p.key_name.lower() == policy_name.lower()]
     if regenerate_key == RenewKeyType.Primary.value:
-        requested_policy[0].primary_key = generateKey()
+        requested_policy.primary_key = generateKey()
     if regenerate_key == RenewKeyType.Secondary.value:
-        requested_policy[0].secondary_key = generateKey()
+        requested_policy.secondary_key = generateKey()
     if regenerate_key == RenewKeyType.Swap.value:
-        temp = requested_policy[0].primary_key
-        requested_policy[0].primary_key = requested_policy[0].secondary_key
-        requested_policy[0].secondary_key = temp
-    updated_policies.append(SharedAccessSignatureAuthorizationRule(key_name=requested_policy[0].key_name,
-                                                                   rights=requested_policy[0].rights,
-                                                                   primary_key=requested_policy[0].primary_key,
-                                                                   secondary_key=requested_policy[0].secondary_key))
+        temp = requested_policy.primary_key
+        requested_policy.primary_key = requested_policy.secondary_key
+        requested_policy.secondary_key = temp
+    updated_policies.append(SharedAccessSignatureAuthorizationRule(key_name=requested_policy.key_name,
+                                                                   rights=requested_policy.rights,
+                                                                   primary_key=requested_policy.primary_key,
+                                                                   secondary_key=requested_policy.secondary_key))
     hub.properties.authorization_policies = updated_policies
     if no_wait:
         return client.iot_hub_resource.create_or_update(hub.additional_properties['resourcegroup'], hub_name, hub, {'IF-MATCH': hub.etag})
@@ -629,9 +577,25 @@ def iot_hub_policy_key_renew(cmd, client, hub_name, policy_name, regenerate_key,
     return iot_hub_policy_get(client, hub_name, policy_name, resource_group_name)
 
 
+def _get_hub_and_policies(cmd, client, hub_name, resource_group_name):
+    if resource_group_name is None:
+        hub = iot_hub_get(cmd, client, hub_name)
+        return hub, list(iot_hub_policy_list(client, hub_name, hub.additional_properties['resourcegroup']))
+    from concurrent.futures import ThreadPoolExecutor
+
+    def _list_policies():
+        return list(iot_hub_policy_list(client, hub_name, resource_group_name))
+
+    # with the resource group known, the hub and its keys are independent requests, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hub = executor.submit(iot_hub_get, cmd, client, hub_name, resource_group_name)
+        policies = executor.submit(_list_policies)
+        return hub.result(), policies.result()
+
+
 def _is_policy_existed(policies, policy_name):
-    policy_set = {p.key_name.lower() for p in policies}
-    return policy_name.lower() in policy_set
+    target = policy_name.lower()
+    return any(p.key_name == policy_name or p.key_name.lower() == target for p in policies)
 
 
 def iot_hub_job_list(client, hub_name, resource_group_name=None):
@@ -651,8 +615,7 @@ def iot_hub_job_cancel(client, hub_name, job_id, resource_group_name=None):
 
 def iot_hub_get_quota_metrics(client, hub_name, resource_group_name=None):
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
-    iotHubQuotaMetricCollection = []
-    iotHubQuotaMetricCollection.extend(client.iot_hub_resource.get_quota_metrics(resource_group_name, hub_name))
+    iotHubQuotaMetricCollection = list(client.iot_hub_resource.get_quota_metrics(resource_group_name, hub_name))
     for quotaMetric in iotHubQuotaMetricCollection:
         if quotaMetric.name == 'TotalDeviceCount':
             quotaMetric.max_value = 'Unlimited'
@@ -664,56 +627,46 @@ def iot_hub_get_stats(client, hub_name, resource_group_name=None):
     return client.iot_hub_resource.get_stats(resource_group_name, hub_name)
 
 
+# Routing endpoint collection and SDK model for each endpoint type.
+_ROUTING_ENDPOINT_TYPES = {
+    EndpointType.EventHub.value: ('event_hubs', 'RoutingEventHubProperties'),
+    EndpointType.ServiceBusQueue.value: ('service_bus_queues', 'RoutingServiceBusQueueEndpointProperties'),
+    EndpointType.ServiceBusTopic.value: ('service_bus_topics', 'RoutingServiceBusTopicEndpointProperties'),
+    EndpointType.AzureStorageContainer.value: ('storage_containers', 'RoutingStorageContainerProperties')
+}
+
+# Endpoint collections in the order they are searched when an endpoint is addressed by name.
+_ROUTING_ENDPOINT_COLLECTIONS = ('service_bus_queues', 'service_bus_topics', 'storage_containers', 'event_hubs')
+
+
 def iot_hub_routing_endpoint_create(cmd, client, hub_name, endpoint_name, endpoint_type,
                                     endpoint_resource_group, endpoint_subscription_id,
                                     connection_string, container_name=None, encoding=None,
                                     resource_group_name=None, batch_frequency=300, chunk_size_window=300,
                                     file_name_format='{iothub}/{partition}/{YYYY}/{MM}/{DD}/{HH}/{mm}'):
+    from azure.mgmt.iothub import models
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    if EndpointType.EventHub.value == endpoint_type.lower():
-        hub.properties.routing.endpoints.event_hubs.append(
-            RoutingEventHubProperties(
-                connection_string=connection_string,
-                name=endpoint_name,
-                subscription_id=endpoint_subscription_id,
-                resource_group=endpoint_resource_group
-            )
-        )
-    elif EndpointType.ServiceBusQueue.value == endpoint_type.lower():
-        hub.properties.routing.endpoints.service_bus_queues.append(
-            RoutingServiceBusQueueEndpointProperties(
-                connection_string=connection_string,
-                name=endpoint_name,
-                subscription_id=endpoint_subscription_id,
-                resource_group=endpoint_resource_group
-            )
-        )
-    elif EndpointType.ServiceBusTopic.value == endpoint_type.lower():
-        hub.properties.routing.endpoints.service_bus_topics.append(
-            RoutingServiceBusTopicEndpointProperties(
-                connection_string=connection_string,
-                name=endpoint_name,
-                subscription_id=endpoint_subscription_id,
-                resource_group=endpoint_resource_group
-            )
-        )
-    elif EndpointType.AzureStorageContainer.value == endpoint_type.lower():
-        if not container_name:
-            raise CLIError("Container name is required.")
-        hub.properties.routing.endpoints.storage_containers.append(
-            RoutingStorageContainerProperties(
-                connection_string=connection_string,
-                name=endpoint_name,
-                subscription_id=endpoint_subscription_id,
-                resource_group=endpoint_resource_group,
+    endpoint_type = endpoint_type.lower()
+    if endpoint_type in _ROUTING_ENDPOINT_TYPES:
+        collection_name, model_name = _ROUTING_ENDPOINT_TYPES[endpoint_type]
+        endpoint_properties = {
+            'connection_string': connection_string,
+            'name': endpoint_name,
+            'subscription_id': endpoint_subscription_id,
+            'resource_group': endpoint_resource_group
+        }
+        if endpoint_type == EndpointType.AzureStorageContainer.value:
+            if not container_name:
+                raise CLIError("Container name is required.")
+            endpoint_properties.update(
                 container_name=container_name,
                 encoding=encoding.lower() if encoding else EncodingFormat.AVRO.value,
                 file_name_format=file_name_format,
                 batch_frequency_in_seconds=batch_frequency,
-                max_chunk_size_in_bytes=(chunk_size_window * 1048576)
-            )
-        )
+                max_chunk_size_in_bytes=(chunk_size_window * 1048576))
+        getattr(hub.properties.routing.endpoints, collection_name).append(
+            getattr(models, model_name)(**endpoint_properties))
     return client.iot_hub_resource.create_or_update(resource_group_name, hub_name, hub, {'IF-MATCH': hub.etag})
 
 
@@ -722,31 +675,22 @@ def iot_hub_routing_endpoint_list(cmd, client, hub_name, endpoint_type=None, res
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
     if not endpoint_type:
         return hub.properties.routing.endpoints
-    if EndpointType.EventHub.value == endpoint_type.lower():
-        return hub.properties.routing.endpoints.event_hubs
-    if EndpointType.ServiceBusQueue.value == endpoint_type.lower():
-        return hub.properties.routing.endpoints.service_bus_queues
-    if EndpointType.ServiceBusTopic.value == endpoint_type.lower():
-        return hub.properties.routing.endpoints.service_bus_topics
-    if EndpointType.AzureStorageContainer.value == endpoint_type.lower():
-        return hub.properties.routing.endpoints.storage_containers
+    endpoint_type = endpoint_type.lower()
+    if endpoint_type in _ROUTING_ENDPOINT_TYPES:
+        return getattr(hub.properties.routing.endpoints, _ROUTING_ENDPOINT_TYPES[endpoint_type][0])
+    return None
 
 
 def iot_hub_routing_endpoint_show(cmd, client, hub_name, endpoint_name, resource_group_name=None):
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    for event_hub in hub.properties.routing.endpoints.event_hubs:
-        if event_hub.name.lower() == endpoint_name.lower():
-            return event_hub
-    for service_bus_queue in hub.properties.routing.endpoints.service_bus_queues:
-        if service_bus_queue.name.lower() == endpoint_name.lower():
-            return service_bus_queue
-    for service_bus_topic in hub.properties.routing.endpoints.service_bus_topics:
-        if service_bus_topic.name.lower() == endpoint_name.lower():
-            return service_bus_topic
-    for storage_container in hub.properties.routing.endpoints.storage_containers:
-        if storage_container.name.lower() == endpoint_name.lower():
-            return storage_container
+    endpoints = hub.properties.routing.endpoints
+    # chained in reverse so that, on a name clash, the first type in the original search order wins
+    endpoint_index = _index_by_name(chain(endpoints.storage_containers, endpoints.service_bus_topics,
+                                          endpoints.service_bus_queues, endpoints.event_hubs), 'name')
+    endpoint = endpoint_index.get(endpoint_name.lower())
+    if endpoint is not None:
+        return endpoint
     raise CLIError("No endpoint found.")
 
 
@@ -759,6 +703,7 @@ def iot_hub_routing_endpoint_delete(cmd, client, hub_name, endpoint_name=None, e
 
 def iot_hub_route_create(cmd, client, hub_name, route_name, source_type, endpoint_name, enabled=None, condition=None,
                          resource_group_name=None):
+    from azure.mgmt.iothub.models import RouteProperties
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
     hub.properties.routing.routes.append(
@@ -784,8 +729,9 @@ def iot_hub_route_list(cmd, client, hub_name, source_type=None, resource_group_n
 def iot_hub_route_show(cmd, client, hub_name, route_name, resource_group_name=None):
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
+    target = route_name.lower()
     for route in hub.properties.routing.routes:
-        if route.name.lower() == route_name.lower():
+        if route.name.lower() == target:
             return route
     raise CLIError("No route found.")
 
@@ -795,12 +741,11 @@ def iot_hub_route_delete(cmd, client, hub_name, route_name=None, source_type=Non
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
     if not route_name and not source_type:
         hub.properties.routing.routes = []
-    if route_name:
-        hub.properties.routing.routes = [route for route in hub.properties.routing.routes
-                                         if route.name.lower() != route_name.lower()]
-    if source_type:
+    else:
+        route_name = route_name.lower() if route_name else None
+        source_type = source_type.lower() if source_type else None
         hub.properties.routing.routes = [route for route in hub.properties.routing.routes
-                                         if route.source.lower() != source_type.lower()]
+                                         if route.name.lower() != route_name and route.source.lower() != source_type]
     return client.iot_hub_resource.create_or_update(resource_group_name, hub_name, hub, {'IF-MATCH': hub.etag})
 
 
@@ -822,6 +767,7 @@ def iot_hub_route_update(cmd, client, hub_name, route_name, source_type=None, en
 
 def iot_hub_route_test(cmd, client, hub_name, route_name=None, source_type=None, body=None, app_properties=None,
                        system_properties=None, resource_group_name=None):
+    from azure.mgmt.iothub.models import RoutingMessage, TestRouteInput, TestAllRoutesInput
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     route_message = RoutingMessage(
         body=body,
@@ -846,6 +792,7 @@ def iot_hub_route_test(cmd, client, hub_name, route_name=None, source_type=None,
 
 
 def iot_message_enrichment_create(cmd, client, hub_name, key, value, endpoints, resource_group_name=None):
+    from azure.mgmt.iothub.models import EnrichmentProperties
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
     if hub.properties.routing.enrichments is None:
@@ -857,9 +804,8 @@ def iot_message_enrichment_create(cmd, client, hub_name, key, value, endpoints,
 def iot_message_enrichment_update(cmd, client, hub_name, key, value, endpoints, resource_group_name=None):
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    to_update = next((endpoint for endpoint in hub.properties.routing.enrichments if endpoint.key == key), None)
+    to_update = next((endpoint for endpoint in hub.properties.routing.enrichments or [] if endpoint.key == key), None)
     if to_update:
-        to_update.key = key
         to_update.value = value
         to_update.endpoint_names = endpoints
         return client.iot_hub_resource.create_or_update(resource_group_name, hub_name, hub, {'IF-MATCH': hub.etag})
@@ -869,9 +815,10 @@ def iot_message_enrichment_update(cmd, client, hub_name, key, value, endpoints,
 def iot_message_enrichment_delete(cmd, client, hub_name, key, resource_group_name=None):
     resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     hub = iot_hub_get(cmd, client, hub_name, resource_group_name)
-    to_remove = next((endpoint for endpoint in hub.properties.routing.enrichments if endpoint.key == key), None)
-    if to_remove:
-        hub.properties.routing.enrichments.remove(to_remove)
+    enrichments = hub.properties.routing.enrichments or []
+    index = next((i for i, endpoint in enumerate(enrichments) if endpoint.key == key), None)
+    if index is not None:
+        del enrichments[index]
         return client.iot_hub_resource.create_or_update(resource_group_name, hub_name, hub, {'IF-MATCH': hub.etag})
     raise CLIError('No message enrichment with that key exists')
 
@@ -967,9 +914,11 @@ def _pnp_create_update_authkeys(cmd, client, repo_endpoint, repo_id, user_role,
 
 
 def _get_device_client(client, resource_group_name, hub_name, device_id):
-    resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
+    from azure.cli.command_modules.iot.mgmt_iot_hub_device.lib.iot_hub_device_client import IotHubDeviceClient
+    from azure.cli.command_modules.iot.sas_token_auth import SasTokenAuthentication
     # Intermediate fix to support domains beyond azure-devices.net
     hub = _get_iot_hub_by_name(client, hub_name)
+    resource_group_name = _ensure_resource_group_name(client, resource_group_name, hub_name)
     base_url = hub.properties.host_name
     uri = '{0}/devices/{1}'.format(base_url, device_id)
     access_policy = iot_hub_policy_get(client, hub_name, 'iothubowner', resource_group_name)
@@ -977,14 +926,21 @@ def _get_device_client(client, resource_group_name, hub_name, device_id):
     return IotHubDeviceClient(creds, client.iot_hub_resource.config.subscription_id, base_url='https://' + base_url).iot_hub_devices
 
 
+# Resource group of each hub found by a subscription scan, kept per client. Clients are created per command,
+# so this only spares repeated scans within a single invocation.
+_hub_resource_groups = weakref.WeakKeyDictionary()
+
+
 def _get_iot_hub_by_name(client, hub_name):
     all_hubs = iot_hub_list(client)
     if all_hubs is None:
         raise CLIError("No IoT Hub found in current subscription.")
+    target = hub_name.lower()
     try:
-        target_hub = next(x for x in all_hubs if hub_name.lower() == x.name.lower())
+        target_hub = next(x for x in all_hubs if x.name == hub_name or x.name.lower() == target)
     except StopIteration:
         raise CLIError("No IoT Hub found with name {} in current subscription.".format(hub_name))
+    _hub_resource_groups.setdefault(client, {})[target] = target_hub.additional_properties['resourcegroup']
     return target_hub
 
 
@@ -995,45 +951,58 @@ def _ensure_location(cli_ctx, resource_group_name, location):
     return location
 
 
-def _ensure_resource_group_existence(cli_ctx, resource_group_name):
-    resource_group_client = resource_service_factory(cli_ctx).resource_groups
-    return resource_group_client.check_existence(resource_group_name)
-
-
 def _ensure_resource_group_name(client, resource_group_name, hub_name):
     if resource_group_name is None:
+        cached = _hub_resource_groups.get(client, {}).get(hub_name.lower())
+        if cached is not None:
+            return cached
         return _get_iot_hub_by_name(client, hub_name).additional_properties['resourcegroup']
     return resource_group_name
 
 
+_PERMISSION_BITS = {
+    'registryread': 1,
+    'registrywrite': 2,
+    'serviceconnect': 4,
+    'deviceconnect': 8
+}
+
+# AccessRights member names indexed by the OR of the permission bits above.
+_ACCESS_RIGHTS_BY_MASK = (
+    None,
+    'registry_read',
+    'registry_write',
+    'registry_read_registry_write',
+    'service_connect',
+    'registry_read_service_connect',
+    'registry_write_service_connect',
+    'registry_read_registry_write_service_connect',
+    'device_connect',
+    'registry_read_device_connect',
+    'registry_write_device_connect',
+    'registry_read_registry_write_device_connect',
+    'service_connect_device_connect',
+    'registry_read_service_connect_device_connect',
+    'registry_write_service_connect_device_connect',
+    'registry_read_registry_write_service_connect_device_connect'
+)
+
+
 # Convert permission list to AccessRights from IoT SDK.
 def _convert_perms_to_access_rights(perm_list):
-    perm_set = set(perm_list)  # remove duplicate
-    sorted_perm_list = sorted(perm_set)
-    perm_key = '_'.join(sorted_perm_list)
-    access_rights_mapping = {
-        'registryread': AccessRights.registry_read,
-        'registrywrite': AccessRights.registry_write,
-        'serviceconnect': AccessRights.service_connect,
-        'deviceconnect': AccessRights.device_connect,
-        'registryread_registrywrite': AccessRights.registry_read_registry_write,
-        'registryread_serviceconnect': AccessRights.registry_read_service_connect,
-        'deviceconnect_registryread': AccessRights.registry_read_device_connect,
-        'registrywrite_serviceconnect': AccessRights.registry_write_service_connect,
-        'deviceconnect_registrywrite': AccessRights.registry_write_device_connect,
-        'deviceconnect_serviceconnect': AccessRights.service_connect_device_connect,
-        'registryread_registrywrite_serviceconnect': AccessRights.registry_read_registry_write_service_connect,
-        'deviceconnect_registryread_registrywrite': AccessRights.registry_read_registry_write_device_connect,
-        'deviceconnect_registryread_serviceconnect': AccessRights.registry_read_service_connect_device_connect,
-        'deviceconnect_registrywrite_serviceconnect': AccessRights.registry_write_service_connect_device_connect,
-        'deviceconnect_registryread_registrywrite_serviceconnect': AccessRights.registry_read_registry_write_service_connect_device_connect
-    }
-    return access_rights_mapping[perm_key]
-
-
-def _is_linked_hub_existed(hubs, hub_name):
-    hub_set = {h.name.lower() for h in hubs}
-    return hub_name.lower() in hub_set
+    from azure.mgmt.iothub.models import AccessRights
+    mask = 0
+    for perm in perm_list:  # duplicates fold into the same bit
+        mask |= _PERMISSION_BITS[perm]
+    return getattr(AccessRights, _ACCESS_RIGHTS_BY_MASK[mask])
+
+
+def _find_certificate(cert_list, certificate_name):
+    return next((c for c in cert_list.value if c.name == certificate_name), None)
+
+
+def _index_by_name(items, attr):
+    return {getattr(i, attr).lower(): i for i in items}
 
 
 def _get_iot_dps_by_name(client, dps_name, resource_group=None):
@@ -1060,33 +1029,21 @@ def _convert_rights_to_access_rights(right_list):
 
 def _delete_routing_endpoints(endpoint_name, endpoint_type, endpoints):
     if endpoint_type:
-        if EndpointType.ServiceBusQueue.value == endpoint_type.lower():
-            endpoints.service_bus_queues = []
-        elif EndpointType.ServiceBusTopic.value == endpoint_type.lower():
-            endpoints.service_bus_topics = []
-        elif EndpointType.AzureStorageContainer.value == endpoint_type.lower():
-            endpoints.storage_containers = []
-        elif EndpointType.EventHub.value == endpoint_type.lower():
-            endpoints.event_hubs = []
+        endpoint_type = endpoint_type.lower()
+        if endpoint_type in _ROUTING_ENDPOINT_TYPES:
+            setattr(endpoints, _ROUTING_ENDPOINT_TYPES[endpoint_type][0], [])
 
     if endpoint_name:
-        if any(e.name.lower() == endpoint_name.lower() for e in endpoints.service_bus_queues):
-            sbq_endpoints = [e for e in endpoints.service_bus_queues if e.name.lower() != endpoint_name.lower()]
-            endpoints.service_bus_queues = sbq_endpoints
-        elif any(e.name.lower() == endpoint_name.lower() for e in endpoints.service_bus_topics):
-            sbt_endpoints = [e for e in endpoints.service_bus_topics if e.name.lower() != endpoint_name.lower()]
-            endpoints.service_bus_topics = sbt_endpoints
-        elif any(e.name.lower() == endpoint_name.lower() for e in endpoints.storage_containers):
-            sc_endpoints = [e for e in endpoints.storage_containers if e.name.lower() != endpoint_name.lower()]
-            endpoints.storage_containers = sc_endpoints
-        elif any(e.name.lower() == endpoint_name.lower() for e in endpoints.event_hubs):
-            eh_endpoints = [e for e in endpoints.event_hubs if e.name.lower() != endpoint_name.lower()]
-            endpoints.event_hubs = eh_endpoints
+        target = endpoint_name.lower()
+        for collection_name in _ROUTING_ENDPOINT_COLLECTIONS:
+            collection = getattr(endpoints, collection_name)
+            index = next((i for i, e in enumerate(collection) if e.name.lower() == target), None)
+            if index is not None:
+                del collection[index]
+                break
 
     if not endpoint_type and not endpoint_name:
-        endpoints.service_bus_queues = []
-        endpoints.service_bus_topics = []
-        endpoints.storage_containers = []
-        endpoints.event_hubs = []
+        for collection_name in _ROUTING_ENDPOINT_COLLECTIONS:
+            setattr(endpoints, collection_name, [])
 
     return endpoints
@@ -62,3 +62,29 @@ class RenewKeyType(Enum):
     Primary = 'primary'
     Secondary = 'secondary'
     Swap = 'swap'
+
+
+# pylint: disable=too-few-public-methods
+class KeyType(Enum):
+    """
+    Type of the shared access key.
+    """
+    primary = 'primary'
+    secondary = 'secondary'
+
+
+# This is a work around to simplify the permission parameter for access policy creation, and also align with the other
+# command modules.
+# The original AccessRights enum is a combination of below four basic access rights.
+# In order to avoid asking for comma- & space-separated strings from the user, a space-separated list is supported for
+# assigning multiple permissions.
+# The underlying IoT SDK should handle this. However it isn't right now. Remove this after it is fixed in IoT SDK.
+# pylint: disable=too-few-public-methods
+class SimpleAccessRights(Enum):
+    """
+    Basic access rights of the shared access policy.
+    """
+    registry_read = 'RegistryRead'
+    registry_write = 'RegistryWrite'
+    service_connect = 'ServiceConnect'
+    device_connect = 'DeviceConnect'
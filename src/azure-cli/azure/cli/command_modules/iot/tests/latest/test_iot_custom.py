@@ -0,0 +1,67 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for license information.
+# --------------------------------------------------------------------------------------------
+
+import unittest
+import mock
+
+from knack.util import CLIError
+from azure.mgmt.iothub.models import ErrorDetailsException
+from azure.mgmt.iothubprovisioningservices.models import IotHubDefinitionDescription
+
+from azure.cli.command_modules.iot.custom import iot_hub_get, iot_dps_linked_hub_update
+
+
+def _error_details_exception(status_code, text):
+    response = mock.MagicMock(spec=['status_code', 'text', 'reason', 'headers'], status_code=status_code, text=text)
+    return ErrorDetailsException(mock.MagicMock(), response)
+
+
+class TestIotHubGet(unittest.TestCase):
+    def _get_with_error(self, error):
+        client = mock.MagicMock()
+        client.iot_hub_resource.get.side_effect = error
+        return iot_hub_get(None, client, 'hub1', 'rg1')
+
+    def test_hub_get_missing_resource_group(self):
+        error = _error_details_exception(404, '{"error": {"code": "ResourceGroupNotFound", '
+                                              '"message": "Resource group \'rg1\' could not be found."}}')
+        with self.assertRaises(CLIError) as context:
+            self._get_with_error(error)
+        self.assertEqual(str(context.exception), "Resource group 'rg1' could not be found.")
+
+    def test_hub_get_missing_hub(self):
+        error = _error_details_exception(404, '{"error": {"code": "ResourceNotFound", '
+                                              '"message": "The Resource \'hub1\' was not found."}}')
+        with self.assertRaises(CLIError) as context:
+            self._get_with_error(error)
+        self.assertEqual(str(context.exception), "An IotHub 'hub1' under resource group 'rg1' was not found.")
+
+    def test_hub_get_reraises_other_errors(self):
+        error = _error_details_exception(403, '{"error": {"code": "AuthorizationFailed"}}')
+        with self.assertRaises(ErrorDetailsException) as context:
+            self._get_with_error(error)
+        self.assertIs(context.exception, error)
+
+
+class TestIotDpsLinkedHub(unittest.TestCase):
+    def test_linked_hub_update_ignores_name_case(self):
+        hub = IotHubDefinitionDescription(connection_string='HostName=myhub.azure-devices.net', location='westus')
+        hub.name = 'myhub.azure-devices.net'
+        dps = mock.MagicMock()
+        dps.properties.iot_hubs = [hub]
+        client = mock.MagicMock()
+        client.iot_dps_resource.get.return_value = dps
+
+        with mock.patch('azure.cli.command_modules.iot.custom.LongRunningOperation'):
+            result = iot_dps_linked_hub_update(mock.MagicMock(), client, 'dps1', 'rg1', 'MyHub.azure-devices.net',
+                                               allocation_weight=5)
+
+        self.assertIs(result, hub)
+        self.assertEqual(hub.allocation_weight, 5)
+        client.iot_dps_resource.create_or_update.assert_called_once_with('rg1', 'dps1', dps)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for license information.
+# --------------------------------------------------------------------------------------------
+
+import unittest
+import mock
+
+from azure.cli.command_modules.iot._params import _get_cached_resource_name_completion_list
+
+
+class TestIotParams(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('azure.cli.core._profile.Profile')
+        self.profile = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.profile.return_value.get_subscription_id.return_value = 'sub1'
+
+    def test_resource_name_completer_is_cached_per_resource_group(self):
+        completer = mock.MagicMock(return_value=['hub1'])
+        with mock.patch('azure.cli.command_modules.iot._params.get_resource_name_completion_list') as factory:
+            factory.return_value.func = completer
+            cached = _get_cached_resource_name_completion_list('Microsoft.Devices/IotHubs')
+
+        namespace = mock.MagicMock(resource_group_name='rg1')
+        self.assertEqual(cached.func(mock.MagicMock(), '', namespace), ['hub1'])
+        self.assertEqual(cached.func(mock.MagicMock(), '', namespace), ['hub1'])
+        self.assertEqual(completer.call_count, 1)
+
+        namespace.resource_group_name = 'rg2'
+        cached.func(mock.MagicMock(), '', namespace)
+        self.assertEqual(completer.call_count, 2)
+
+    def test_resource_name_completer_is_cached_per_subscription(self):
+        completer = mock.MagicMock(side_effect=[['hub1'], ['hub2']])
+        with mock.patch('azure.cli.command_modules.iot._params.get_resource_name_completion_list') as factory:
+            factory.return_value.func = completer
+            cached = _get_cached_resource_name_completion_list('Microsoft.Devices/IotHubs')
+
+        namespace = mock.MagicMock(resource_group_name=None)
+        self.assertEqual(cached.func(mock.MagicMock(), '', namespace), ['hub1'])
+
+        self.profile.return_value.get_subscription_id.return_value = 'sub2'
+        self.assertEqual(cached.func(mock.MagicMock(), '', namespace), ['hub2'])
+
+        self.profile.return_value.get_subscription_id.return_value = 'sub1'
+        self.assertEqual(cached.func(mock.MagicMock(), '', namespace), ['hub1'])
+        self.assertEqual(completer.call_count, 2)
+
+    def test_resource_name_completer_expires(self):
+        completer = mock.MagicMock(return_value=['hub1'])
+        with mock.patch('azure.cli.command_modules.iot._params.get_resource_name_completion_list') as factory:
+            factory.return_value.func = completer
+            cached = _get_cached_resource_name_completion_list('Microsoft.Devices/IotHubs', ttl=60)
+
+        namespace = mock.MagicMock(resource_group_name=None)
+        with mock.patch('azure.cli.command_modules.iot._params.time.time', side_effect=[0, 30, 100]):
+            cached.func(mock.MagicMock(), '', namespace)
+            cached.func(mock.MagicMock(), '', namespace)
+            cached.func(mock.MagicMock(), '', namespace)
+        self.assertEqual(completer.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,10 @@
 
 from __future__ import print_function
 
+import base64
 import os
+import shutil
+import tempfile
 import time
 import unittest
 from datetime import datetime, timedelta
@@ -28,6 +31,9 @@ def _asn1_to_iso8601(asn1_date):
 
 
 TEST_DIR = os.path.abspath(os.path.join(os.path.abspath(__file__), '..'))
+SECRET_FILE_PATH = os.path.join(TEST_DIR, 'test_secret.txt')
+PEM_PLAIN_CERT_PATH = os.path.join(TEST_DIR, 'import_pem_plain.pem')
+PEM_CERT_POLICY_PATH = os.path.join(TEST_DIR, 'policy_import_pem.json')
 
 
 def _create_keyvault(test, kwargs, additional_args=None):
@@ -191,7 +197,9 @@ class KeyVaultKeyScenarioTest(ScenarioTest):
         ])
 
         # backup and then delete key
-        key_file = 'backup.key'
+        backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, backup_dir, True)
+        key_file = os.path.join(backup_dir, 'backup.key')
         self.kwargs['key_file'] = key_file
         self.cmd('keyvault key backup --vault-name {kv} -n {key} --file {key_file}')
         self.cmd('keyvault key delete --vault-name {kv} -n {key}')
@@ -202,8 +210,6 @@ class KeyVaultKeyScenarioTest(ScenarioTest):
         self.cmd('keyvault key restore --vault-name {kv} --file {key_file}')
         self.cmd('keyvault key list-versions --vault-name {kv} -n {key}',
                  checks=self.check('length(@)', 2))
-        if os.path.isfile(key_file):
-            os.remove(key_file)
 
         # import PEM
         self.kwargs.update({
@@ -236,9 +242,8 @@ class KeyVaultKeyScenarioTest(ScenarioTest):
 class KeyVaultSecretScenarioTest(ScenarioTest):
 
     def _test_download_secret(self):
-        secret_path = os.path.join(TEST_DIR, 'test_secret.txt')
-        self.kwargs['src_path'] = secret_path
-        with open(secret_path, 'r') as f:
+        self.kwargs['src_path'] = SECRET_FILE_PATH
+        with open(SECRET_FILE_PATH, 'r') as f:
             expected = f.read().replace('\r\n', '\n')
 
         def _test_set_and_download(encoding):
@@ -310,7 +315,9 @@ class KeyVaultSecretScenarioTest(ScenarioTest):
         ])
 
         # backup and then delete secret
-        bak_file = 'backup.secret'
+        backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, backup_dir, True)
+        bak_file = os.path.join(backup_dir, 'backup.secret')
         self.kwargs['bak_file'] = bak_file
         self.cmd('keyvault secret backup --vault-name {kv} -n {sec} --file {bak_file}')
         self.cmd('keyvault secret delete --vault-name {kv} -n {sec}')
@@ -320,8 +327,6 @@ class KeyVaultSecretScenarioTest(ScenarioTest):
         self.cmd('keyvault secret restore --vault-name {kv} --file {bak_file}')
         self.cmd('keyvault secret list-versions --vault-name {kv} -n {sec}',
                  checks=self.check('length(@)', 2))
-        if os.path.isfile(bak_file):
-            os.remove(bak_file)
 
         # delete secret
         self.cmd('keyvault secret delete --vault-name {kv} -n {sec}')
@@ -427,7 +432,7 @@ class KeyVaultPendingCertificateScenarioTest(ScenarioTest):
 
         _create_keyvault(self, self.kwargs)
 
-        self.kwargs['fake_cert_path'] = os.path.join(TEST_DIR, 'import_pem_plain.pem')
+        self.kwargs['fake_cert_path'] = PEM_PLAIN_CERT_PATH
         self.cmd('keyvault certificate create --vault-name {kv} -n pending-cert -p @"{policy_path}"', checks=[
             self.check('statusDetails', 'Pending certificate created. Please Perform Merge to complete the request.'),
             self.check('cancellationRequested', False),
@@ -458,8 +463,6 @@ class KeyVaultCertificateDownloadScenarioTest(ScenarioTest):
 
     @ResourceGroupPreparer(name_prefix='cli_test_kv_cert_download')
     def test_keyvault_certificate_download(self, resource_group):
-        import OpenSSL.crypto
-
         self.kwargs.update({
             'kv': self.create_random_name('cli-test-keyvault-', 24),
             'loc': 'eastus2'
@@ -467,11 +470,9 @@ class KeyVaultCertificateDownloadScenarioTest(ScenarioTest):
 
         _create_keyvault(self, self.kwargs)
 
-        pem_file = os.path.join(TEST_DIR, 'import_pem_plain.pem')
-        pem_policy_path = os.path.join(TEST_DIR, 'policy_import_pem.json')
         self.kwargs.update({
-            'pem_file': pem_file,
-            'pem_policy_path': pem_policy_path
+            'pem_file': PEM_PLAIN_CERT_PATH,
+            'pem_policy_path': PEM_CERT_POLICY_PATH
         })
         pem_cert = self.cmd('keyvault certificate import --vault-name {kv} -n pem-cert1 --file "{pem_file}" -p @"{pem_policy_path}"').get_output_in_json()
         cert_data = pem_cert['cer']
@@ -493,16 +494,11 @@ class KeyVaultCertificateDownloadScenarioTest(ScenarioTest):
             self.cmd('keyvault certificate download --vault-name {kv} -n pem-cert1 --file "{dest_string}" -e PEM')
             self.cmd('keyvault certificate delete --vault-name {kv} -n pem-cert1')
 
-            def verify(path, file_type):
-                with open(path, 'rb') as f:
-                    x509 = OpenSSL.crypto.load_certificate(file_type, f.read())
-                    actual_pem = OpenSSL.crypto.dump_certificate(OpenSSL.crypto.FILETYPE_PEM, x509)
-                    if isinstance(actual_pem, bytes):
-                        actual_pem = actual_pem.decode("utf-8")
-                    self.assertIn(expected_pem, actual_pem.replace('\n', ''))
-
-            verify(dest_binary, OpenSSL.crypto.FILETYPE_ASN1)
-            verify(dest_string, OpenSSL.crypto.FILETYPE_PEM)
+            # the DER download is the raw certificate and the PEM download wraps its base64 encoding
+            with open(dest_binary, 'rb') as f:
+                self.assertEqual(base64.b64encode(f.read()).decode('utf-8'), cert_data)
+            with open(dest_string, 'r') as f:
+                self.assertIn(expected_pem, f.read().replace('\n', ''))
         finally:
             if os.path.exists(dest_binary):
                 os.remove(dest_binary)
@@ -564,7 +560,7 @@ class KeyVaultCertificateScenarioTest(ScenarioTest):
         ver_list = self.cmd('keyvault certificate list-versions --vault-name {kv} -n cert1',
                             checks=self.check('length(@)', 2)).get_output_in_json()
 
-        ver_list = sorted(ver_list, key=lambda x: x['attributes']['created'])
+        ver_list.sort(key=lambda x: x['attributes']['created'])
         versions = [x['id'] for x in ver_list]
 
         # show certificate (latest)
@@ -672,8 +668,8 @@ class KeyVaultCertificateImportScenario(ScenarioTest):
         self.kwargs.update({
             'pem_encrypted_file': os.path.join(TEST_DIR, 'import_pem_encrypted_pwd_1234.pem'),
             'pem_encrypted_password': '1234',
-            'pem_plain_file': os.path.join(TEST_DIR, 'import_pem_plain.pem'),
-            'pem_policy_path': os.path.join(TEST_DIR, 'policy_import_pem.json')
+            'pem_plain_file': PEM_PLAIN_CERT_PATH,
+            'pem_policy_path': PEM_CERT_POLICY_PATH
         })
 
         self.cmd('keyvault certificate import --vault-name {kv} -n pem-cert1 --file "{pem_plain_file}" -p @"{pem_policy_path}"')
@@ -693,6 +689,20 @@ class KeyVaultCertificateImportScenario(ScenarioTest):
 # TODO: Convert to ScenarioTest and re-record when issue #5146 is fixed.
 class KeyVaultSoftDeleteScenarioTest(ScenarioTest):
 
+    def _wait_for_deleted(self, kind, names, timeout=60):
+        # deletion is asynchronous; poll with backoff until the items show up as deleted instead of sleeping
+        deadline = time.time() + timeout
+        delay = 1
+        while True:
+            deleted = self.cmd('keyvault {} list-deleted --vault-name {{kv}}'.format(kind)).get_output_in_json()
+            missing = set(names) - {(item.get('kid') or item['id']).rsplit('/', 1)[1] for item in deleted}
+            if not missing:
+                return
+            if time.time() + delay > deadline:
+                self.fail('{} {} not listed as deleted after {}s'.format(kind, ', '.join(sorted(missing)), timeout))
+            time.sleep(delay)
+            delay = min(delay * 2, 16)
+
     @ResourceGroupPreparer(name_prefix='cli_test_keyvault_sd')
     def test_keyvault_softdelete(self, resource_group):
 
@@ -705,19 +715,13 @@ class KeyVaultSoftDeleteScenarioTest(ScenarioTest):
 
         # add all purge permissions to default the access policy
         default_policy = vault['properties']['accessPolicies'][0]
-        cert_perms = default_policy['permissions']['certificates']
-        key_perms = default_policy['permissions']['keys']
-        secret_perms = default_policy['permissions']['secrets']
-        obj_id = default_policy['objectId']
-
-        for p in [cert_perms, key_perms, secret_perms]:
-            p.append('purge')
+        permissions = default_policy['permissions']
 
         self.kwargs.update({
-            'obj_id': obj_id,
-            'key_perms': ' '.join(key_perms),
-            'secret_perms': ' '.join(secret_perms),
-            'cert_perms': ' '.join(cert_perms)
+            'obj_id': default_policy['objectId'],
+            'key_perms': ' '.join(permissions['keys'] + ['purge']),
+            'secret_perms': ' '.join(permissions['secrets'] + ['purge']),
+            'cert_perms': ' '.join(permissions['certificates'] + ['purge'])
         })
 
         self.cmd('keyvault set-policy -n {kv} --object-id {obj_id} --key-permissions {key_perms} --secret-permissions {secret_perms} --certificate-permissions {cert_perms}')
@@ -734,8 +738,8 @@ class KeyVaultSoftDeleteScenarioTest(ScenarioTest):
                  checks=self.check('attributes.enabled', True))
 
         self.kwargs.update({
-            'pem_plain_file': os.path.join(TEST_DIR, 'import_pem_plain.pem'),
-            'pem_policy_path': os.path.join(TEST_DIR, 'policy_import_pem.json')
+            'pem_plain_file': PEM_PLAIN_CERT_PATH,
+            'pem_policy_path': PEM_CERT_POLICY_PATH
         })
         self.cmd('keyvault certificate import --vault-name {kv} -n cert1 --file "{pem_plain_file}" -p @"{pem_policy_path}"')
         self.cmd('keyvault certificate import --vault-name {kv} -n cert2 --file "{pem_plain_file}" -p @"{pem_policy_path}"')
@@ -749,7 +753,9 @@ class KeyVaultSoftDeleteScenarioTest(ScenarioTest):
         self.cmd('keyvault certificate delete --vault-name {kv} -n cert2')
 
         if self.is_live:
-            time.sleep(20)
+            self._wait_for_deleted('secret', ['secret1', 'secret2'])
+            self._wait_for_deleted('key', ['key1', 'key2'])
+            self._wait_for_deleted('certificate', ['cert1', 'cert2'])
 
         # recover secrets keys and certificates
         self.cmd('keyvault secret recover --vault-name {kv} -n secret1')
@@ -768,7 +774,7 @@ class KeyVaultSoftDeleteScenarioTest(ScenarioTest):
         self.cmd('keyvault purge -n {kv}')
 
         # recover and purge with location
-        _create_keyvault(self, self.kwargs, additional_args=' --enable-soft-delete true').get_output_in_json()
+        _create_keyvault(self, self.kwargs, additional_args=' --enable-soft-delete true')
         self.cmd('keyvault delete -n {kv}')
         self.cmd('keyvault recover -n {kv} -l {loc}', checks=self.check('name', '{kv}'))
         self.cmd('keyvault delete -n {kv}')
@@ -794,7 +800,12 @@ class KeyVaultStorageAccountScenarioTest(ScenarioTest):
         self.kwargs.update({
             'kv': self.create_random_name('cli-test-keyvault-', 24),
             'sa': 'clitestkvsa0000002',
-            'loc': 'westus'
+            'loc': 'westus',
+            'acct_sas_name': 'allacctaccess',
+            'blob_sas_name': 'blob1r',
+            'c': 'cont1',
+            'b': 'blob1',
+            'f': SECRET_FILE_PATH
         })
 
         _create_keyvault(self, self.kwargs)
@@ -808,18 +819,13 @@ class KeyVaultStorageAccountScenarioTest(ScenarioTest):
                                  self.check('autoRegenerateKey', True),
                                  self.check('regenerationPeriod', 'P90D'),
                                  self.check('resourceId', '{sa_rid}')]).get_output_in_json()
-        self.kwargs.update({
-            'sa_id': kv_sa['id']
-        })
+        self.kwargs['sa_id'] = kv_sa['id']
 
         # create an account sas definition
         acct_sas_template = self.cmd('storage account generate-sas --expiry 2020-01-01 --permissions acdlpruw '
                                      '--resource-types sco --services bfqt --https-only --account-name {sa} '
-                                     '--account-key 00000000').output[1:-2]
-        self.kwargs.update({
-            'acct_temp': acct_sas_template,
-            'acct_sas_name': 'allacctaccess'
-        })
+                                     '--account-key 00000000 -o tsv').output.strip()
+        self.kwargs['acct_temp'] = acct_sas_template
         sas_def = self.cmd('keyvault storage sas-definition create --vault-name {kv} --account-name {sa} '
                            '-n {acct_sas_name} --validity-period PT4H --sas-type account --template-uri "{acct_temp}"',
                            checks=[self.check('attributes.enabled', True)]).get_output_in_json()
@@ -831,12 +837,7 @@ class KeyVaultStorageAccountScenarioTest(ScenarioTest):
         # use the account sas token to create a container and a blob
         acct_sas_token = self.cmd('keyvault secret show --id {acct_sas_sid} --query value').output
 
-        self.kwargs.update({
-            'acct_sas': acct_sas_token,
-            'c': 'cont1',
-            'b': 'blob1',
-            'f': os.path.join(TEST_DIR, 'test_secret.txt')
-        })
+        self.kwargs['acct_sas'] = acct_sas_token
         self.cmd('storage container create -n {c} --account-name {sa} --sas-token {acct_sas}',
                  checks=[self.check('created', True)])
 
@@ -845,15 +846,10 @@ class KeyVaultStorageAccountScenarioTest(ScenarioTest):
 
         # create a service sas token for the accessing the blob
         blob_sas_template = self.cmd('storage blob generate-sas -c {c} -n {b} --account-name {sa}'
-                                     ' --account-key 00000000 --permissions r').output[1:-2]
-        blob_url = self.cmd('storage blob url -c {c} -n {b} --account-name {sa}').output[1:-2]
+                                     ' --account-key 00000000 --permissions r -o tsv').output.strip()
+        blob_url = self.cmd('storage blob url -c {c} -n {b} --account-name {sa} -o tsv').output.strip()
 
-        blob_temp = '{}?{}'.format(blob_url, blob_sas_template)
-        print('blob_temp', blob_temp)
-        self.kwargs.update({
-            'blob_temp': blob_temp,
-            'blob_sas_name': 'blob1r'
-        })
+        self.kwargs['blob_temp'] = '{}?{}'.format(blob_url, blob_sas_template)
 
         sas_def = self.cmd('keyvault storage sas-definition create --vault-name {kv} --account-name {sa} '
                            '-n {blob_sas_name} --sas-type service --validity-period P1D --template-uri "{blob_temp}"',
@@ -866,9 +862,7 @@ class KeyVaultStorageAccountScenarioTest(ScenarioTest):
 
         # use the blob sas token to read the blob
         blob_sas_token = self.cmd('keyvault secret show --id {blob_sas_sid} --query value').output
-        self.kwargs.update({
-            'blob_sas': blob_sas_token
-        })
+        self.kwargs['blob_sas'] = blob_sas_token
 
         self.cmd('storage blob show -c {c} -n {b} --account-name {sa} --sas-token {blob_sas}',
                  checks=[self.check('name', '{b}')])
@@ -878,9 +872,7 @@ class KeyVaultStorageAccountScenarioTest(ScenarioTest):
 
         # use the blob sas token to read the blob
         blob_sas_token = self.cmd('keyvault secret show --id {blob_sas_sid} --query value').output
-        self.kwargs.update({
-            'blob_sas': blob_sas_token
-        })
+        self.kwargs['blob_sas'] = blob_sas_token
 
         self.cmd('storage blob show -c {c} -n {b} --account-name {sa} --sas-token {blob_sas}',
                  checks=[self.check('name', '{b}')])
@@ -938,7 +930,7 @@ class KeyVaultNetworkRuleScenarioTest(ScenarioTest):
         })
 
         subnet = self._create_subnet(self, self.kwargs).get_output_in_json()
-        _create_keyvault(self, self.kwargs).get_output_in_json()
+        _create_keyvault(self, self.kwargs)
 
         self.kwargs.update({
             # key vault service will convert subnet ID to lowercase, so convert subnet ID to lowercase in advance